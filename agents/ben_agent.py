@@ -9,12 +9,54 @@ Set in env:
   OPENAI_API_KEY, ELEVENLABS_API_KEY (or as required by plugins)
   AGENT_SEND_SMS_URL – e.g. https://m10djcompany.com/api/livekit/agent-send-sms (optional; enables send_sms tool)
   AGENT_SEND_SMS_TOKEN or LIVEKIT_AGENT_CONFIG_TOKEN – Bearer token for agent-send-sms API
+  AGENT_KNOWLEDGE_URL – per-organization snapshot endpoint for packages/FAQs/venues/booked dates, e.g.
+    https://m10djcompany.com/api/livekit/agent-knowledge (optional; enables lookup_business_info)
+  AGENT_KNOWLEDGE_FILE – local JSON snapshot for M10 (the default tenant) used instead of (or before) the URL
+  AGENT_KNOWLEDGE_TOKEN or LIVEKIT_AGENT_CONFIG_TOKEN – Bearer token for the knowledge snapshot endpoint
+  AGENT_KNOWLEDGE_REFRESH_SECONDS – how often the main worker process pulls deltas (default 300)
+  AGENT_KNOWLEDGE_DIR – on-disk per-tenant snapshots shared by the worker's job processes (default: temp dir)
+  AGENT_CONTEXT_KEEP_TURNS – user turns kept verbatim in the LLM context (default 6); older turns are summarized
+  AGENT_CONTEXT_MAX_TOKENS – approximate token budget for the LLM context (default 6000)
+  AGENT_CONTEXT_SUMMARY_MODEL – model used for background summaries (default openai/gpt-4.1-mini)
+  AGENT_EVENTS_URL – ingest endpoint for batched transcript/tool/latency events, e.g.
+    https://m10djcompany.com/api/livekit/agent-events (optional; enables event export)
+  AGENT_EVENTS_TOKEN or LIVEKIT_AGENT_CONFIG_TOKEN – Bearer token for the ingest endpoint
+  AGENT_EVENTS_BATCH_SIZE / AGENT_EVENTS_FLUSH_SECONDS – flush thresholds (default 50 events / 5 seconds)
+  AGENT_CONFIG_CACHE_SIZE / AGENT_CONFIG_CACHE_TTL – per-tenant config LRU size and TTL seconds (default 64 / 600)
+  AGENT_CONFIG_CACHE_DIR – on-disk config cache shared by the worker's job processes (default: temp dir)
+  AGENT_CONFIG_PREFETCH – comma-separated organization ids or dialed numbers (+1...) kept cached at all times
+  AGENT_CONFIG_REVALIDATE_SECONDS – how often to poll agent-config for admin changes (default 30)
+  AGENT_EVENTS_SPOOL_DIR – where batches are spooled while the endpoint is unreachable (default: temp dir)
+  AGENT_EVENTS_SPOOL_MAX_MB – spool size cap; the oldest batches are dropped past it (default 50)
+  AGENT_NAME – agent name this worker registers with LiveKit (default Ben)
+  AGENT_PERSONAS – JSON map of persona name -> {"settings_name", "tools", "max_sessions"}; a dispatch selects one
+    with metadata {"persona": "<name>"} (default: only Ben, all tools, no session limit)
+  AGENT_DIAGNOSTICS – "rss" or "tracemalloc" to log per-job memory deltas and event-loop stalls (optional);
+    tracemalloc sees Python allocations only, so native noise-cancellation memory shows in RSS alone
+  AGENT_DIAGNOSTICS_PORT – main worker's JSON debug endpoint on 127.0.0.1 (default 8090); job processes use
+    the next free ports above it, which go away when each job's process exits
+  AGENT_DIAGNOSTICS_DIR – where job processes leave their reports for the main endpoint (default: temp dir)
+  AGENT_DIAGNOSTICS_LAG_MS – event-loop stall threshold in milliseconds (default 100)
 """
 import asyncio
+import collections
+import datetime
+import gzip
+import hashlib
+import http.server
 import json
 import logging
+import math
 import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import tracemalloc
 import urllib.error
+import urllib.parse
 import urllib.request
 from dotenv import load_dotenv
 from livekit import rtc
@@ -27,11 +69,13 @@ from livekit.agents import (
     BuiltinAudioClip,
     JobContext,
     JobProcess,
+    JobRequest,
     RunContext,
     cli,
     function_tool,
     get_job_context,
     inference,
+    llm,
     room_io,
 )
 from livekit.plugins import noise_cancellation, silero
@@ -47,7 +91,8 @@ DEFAULT_INSTRUCTIONS = """You are the voice assistant for M10 DJ Company, a prof
 - Represent M10 DJ Company in a friendly, professional way.
 - Answer questions about DJ services, event types (weddings, corporate, parties), and what the company offers.
 - Help callers understand next steps for booking: availability, pricing, and how to get a quote or contract.
-- Do not make up pricing or availability; direct them to the team or booking process when specific quotes are needed.
+- Use the lookup_business_info tool for packages, pricing, FAQs, venues and date availability, and answer from what it returns.
+- Do not make up pricing or availability; direct them to the team or booking process only when the lookup has no answer or a custom quote is needed.
 
 # Output rules
 - Use plain text only. No JSON, markdown, lists, code, or emojis.
@@ -57,31 +102,355 @@ DEFAULT_INSTRUCTIONS = """You are the voice assistant for M10 DJ Company, a prof
 
 # Guardrails
 - Stay on brand: M10 DJ Company, professional and helpful.
-- Do not promise specific prices or dates unless given that information.
+- Do not promise specific prices or dates unless given that information (for example by lookup_business_info).
 - Protect privacy; do not repeat sensitive data unnecessarily."""
 
 DEFAULT_GREETING = "Greet the caller warmly and say you're with M10 DJ Company. Ask how you can help them today."
 
 
-def fetch_agent_config() -> dict:
+def fetch_agent_config(
+    organization_id: str | None = None,
+    dialed_number: str | None = None,
+    settings_name: str | None = None,
+) -> dict:
     url = os.environ.get("LIVEKIT_AGENT_CONFIG_URL", "").rstrip("/")
     token = os.environ.get("LIVEKIT_AGENT_CONFIG_TOKEN", "")
     if not url or not token:
         logger.warning("LIVEKIT_AGENT_CONFIG_URL or LIVEKIT_AGENT_CONFIG_TOKEN not set; using defaults")
         return {}
+    params = {
+        k: v
+        for k, v in (("organization_id", organization_id), ("dialed_number", dialed_number), ("name", settings_name))
+        if v
+    }
+    if params:
+        url = f"{url}?{urllib.parse.urlencode(params)}"
     try:
-        import urllib.request
         req = urllib.request.Request(url, headers={"Authorization": f"Bearer {token}"})
         with urllib.request.urlopen(req, timeout=10) as resp:
             if resp.status != 200:
                 return {}
-            import json
             return json.loads(resp.read().decode())
     except Exception as e:
         logger.warning("Failed to fetch agent config: %s; using defaults", e)
         return {}
 
 
+DEFAULT_SETTINGS_NAME = "default_m10"
+WORKER_AGENT_NAME = os.environ.get("AGENT_NAME", "Ben")
+DEFAULT_PERSONAS = {
+    WORKER_AGENT_NAME: {"settings_name": DEFAULT_SETTINGS_NAME, "tools": None, "max_sessions": 0},
+}
+# Function tools on DefaultAgent that a persona's "tools" list may name.
+AGENT_TOOL_NAMES = frozenset({"send_sms", "lookup_business_info"})
+
+
+def _parse_persona(name: str, spec) -> dict | None:
+    """Validate one AGENT_PERSONAS entry; None (with a warning) when it can't be used."""
+    if spec is None:
+        spec = {}
+    if not isinstance(spec, dict):
+        logger.warning("AGENT_PERSONAS[%r] must be an object; skipping it", name)
+        return None
+    settings_name = spec.get("settings_name") or DEFAULT_SETTINGS_NAME
+    max_sessions = spec.get("max_sessions") or 0
+    tools = spec.get("tools")
+    if not isinstance(settings_name, str):
+        logger.warning("AGENT_PERSONAS[%r].settings_name must be a string; skipping it", name)
+        return None
+    if isinstance(max_sessions, bool) or not isinstance(max_sessions, int) or max_sessions < 0:
+        logger.warning("AGENT_PERSONAS[%r].max_sessions must be a non-negative integer; skipping it", name)
+        return None
+    if tools is not None:
+        if not isinstance(tools, list) or not all(isinstance(t, str) for t in tools):
+            logger.warning("AGENT_PERSONAS[%r].tools must be a list of tool names; skipping it", name)
+            return None
+        unknown = sorted(set(tools) - AGENT_TOOL_NAMES)
+        if unknown:
+            logger.warning("AGENT_PERSONAS[%r].tools: unknown tools %s ignored", name, ", ".join(unknown))
+            tools = [t for t in tools if t in AGENT_TOOL_NAMES]
+    return {"settings_name": settings_name, "tools": tools, "max_sessions": max_sessions}
+
+
+def load_personas() -> dict[str, dict]:
+    """Persona registry: name -> settings row, allowed tool names (None = all) and per-worker session limit."""
+    raw = os.environ.get("AGENT_PERSONAS", "").strip()
+    if not raw:
+        return DEFAULT_PERSONAS
+    try:
+        personas = json.loads(raw)
+    except ValueError as e:
+        logger.warning("Invalid AGENT_PERSONAS (%s); using %s only", e, WORKER_AGENT_NAME)
+        return DEFAULT_PERSONAS
+    if not isinstance(personas, dict) or not personas:
+        logger.warning("AGENT_PERSONAS must be a non-empty JSON object; using %s only", WORKER_AGENT_NAME)
+        return DEFAULT_PERSONAS
+    parsed = {name: _parse_persona(name, spec) for name, spec in personas.items()}
+    valid = {name: persona for name, persona in parsed.items() if persona is not None}
+    if not valid:
+        logger.warning("No usable persona in AGENT_PERSONAS; using %s only", WORKER_AGENT_NAME)
+        return DEFAULT_PERSONAS
+    return valid
+
+
+PERSONAS = load_personas()
+
+
+def _job_metadata(job) -> dict:
+    try:
+        metadata = json.loads(job.metadata or "{}")
+    except (ValueError, AttributeError):
+        return {}
+    return metadata if isinstance(metadata, dict) else {}
+
+
+def resolve_persona(job) -> tuple[str, dict | None]:
+    """Pick the persona for a job from dispatch metadata ``persona``, falling back to the worker's agent name.
+
+    Returns ``(name, None)`` when the metadata names a persona that is not registered, so the
+    caller can reject the job instead of silently running the default persona.
+    """
+    requested = _job_metadata(job).get("persona")
+    name = str(requested or getattr(job, "agent_name", "") or WORKER_AGENT_NAME)
+    by_lower = {k.lower(): k for k in PERSONAS}
+    if name.lower() in by_lower:
+        key = by_lower[name.lower()]
+        return key, PERSONAS[key]
+    if requested:
+        return name, None
+    key = WORKER_AGENT_NAME if WORKER_AGENT_NAME in PERSONAS else next(iter(PERSONAS))
+    return key, PERSONAS[key]
+
+
+def _config_cache_key(organization_id: str | None, dialed_number: str | None, settings_name: str | None = None) -> str:
+    suffix = f"@{settings_name}" if settings_name and settings_name != DEFAULT_SETTINGS_NAME else ""
+    if organization_id:
+        return f"org:{organization_id}{suffix}"
+    if dialed_number:
+        return f"num:{dialed_number}{suffix}"
+    return f"default{suffix}"
+
+
+class AgentConfigCache:
+    """Bounded LRU of per-tenant agent configs with TTL, stored on disk under AGENT_CONFIG_CACHE_DIR.
+
+    LiveKit runs every job in its own short-lived process, so an in-memory cache would serve a
+    single call. Files are shared by all job processes of the worker and survive them; the
+    long-lived main worker process prefetches hot tenants and revalidates entries after admin
+    changes (see start_config_revalidation), so later calls for a tenant are still cache hits.
+    """
+
+    def __init__(self, cache_dir: str, max_entries: int = 64, ttl: float = 600.0) -> None:
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+    @classmethod
+    def from_env(cls) -> "AgentConfigCache":
+        return cls(
+            os.environ.get("AGENT_CONFIG_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "ben-agent-config"),
+            max_entries=int(os.environ.get("AGENT_CONFIG_CACHE_SIZE", "64")),
+            ttl=float(os.environ.get("AGENT_CONFIG_CACHE_TTL", "600")),
+        )
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode()).hexdigest() + ".json")
+
+    def _read(self, path: str) -> dict | None:
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def get(self, key: str) -> dict | None:
+        path = self._path(key)
+        entry = self._read(path)
+        if entry is None:
+            return None
+        if time.time() - entry.get("written_at", 0) > self.ttl:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        try:
+            os.utime(path)  # mtime tracks last use, for LRU eviction
+        except OSError:
+            pass
+        return entry.get("config")
+
+    def put(self, key: str, config: dict) -> None:
+        if not config:
+            return  # never cache a failed fetch
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = self._path(key)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"key": key, "written_at": time.time(), "config": config}, f)
+            os.replace(tmp, path)  # atomic, so readers in other job processes never see a partial file
+            self._evict()
+        except OSError as e:
+            logger.warning("Failed to cache agent config: %s", e)
+
+    def _entries(self) -> list[str]:
+        try:
+            return [os.path.join(self.cache_dir, n) for n in os.listdir(self.cache_dir) if n.endswith(".json")]
+        except OSError:
+            return []
+
+    def _evict(self) -> None:
+        paths = self._entries()
+        if len(paths) <= self.max_entries:
+            return
+
+        def _mtime(path: str) -> float:
+            try:
+                return os.path.getmtime(path)
+            except OSError:
+                return 0.0
+
+        for path in sorted(paths, key=_mtime)[: len(paths) - self.max_entries]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def invalidate(self, organization_ids: set) -> list[str]:
+        """Drop entries for the given organizations (None = platform default). Returns dropped keys.
+
+        An entry matches on the organization that was requested (``org:<id>`` key, or the
+        organization a dialed number resolved to) as well as on the config's own organization_id,
+        so a tenant still served the default config picks up its first settings row.
+        """
+        orgs = {org for org in organization_ids if org}
+        keys = []
+        for path in self._entries():
+            entry = self._read(path)
+            if entry is None:
+                continue
+            key = entry.get("key", "")
+            config = entry.get("config") or {}
+            if (
+                key.partition("@")[0] in {f"org:{org}" for org in orgs}
+                or config.get("organization_id") in organization_ids
+                or config.get("requested_organization_id") in orgs
+            ):
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                keys.append(key)
+        return keys
+
+    def load(self, key: str) -> dict:
+        """Blocking fetch-through for a cache key."""
+        key_base, _, settings_name = key.partition("@")
+        kind, _, value = key_base.partition(":")
+        config = fetch_agent_config(
+            organization_id=value if kind == "org" else None,
+            dialed_number=value if kind == "num" else None,
+            settings_name=settings_name or None,
+        )
+        self.put(key, config)
+        return config
+
+    def get_or_load(self, key: str) -> dict:
+        config = self.get(key)
+        return config if config is not None else self.load(key)
+
+
+def _fetch_config_changes_sync(since: str) -> dict:
+    url = os.environ.get("LIVEKIT_AGENT_CONFIG_URL", "").rstrip("/")
+    token = os.environ.get("LIVEKIT_AGENT_CONFIG_TOKEN", "")
+    req = urllib.request.Request(
+        f"{url}?{urllib.parse.urlencode({'changed_since': since})}",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    with urllib.request.urlopen(req, timeout=10) as resp:
+        return json.loads(resp.read().decode())
+
+
+def start_config_revalidation(cache: AgentConfigCache) -> None:
+    """Run in the main worker process: keep hot tenants cached and refresh entries after admin changes.
+
+    Runs on a daemon thread so nothing here delays worker start or job process initialization;
+    a call that arrives before its tenant is prefetched simply fetches on demand. Prefetched keys are
+    reloaded every half TTL, so they never expire between calls.
+    """
+    if not os.environ.get("LIVEKIT_AGENT_CONFIG_URL") or not os.environ.get("LIVEKIT_AGENT_CONFIG_TOKEN"):
+        return
+    keys = [_config_cache_key(None, None, p["settings_name"]) for p in PERSONAS.values()]
+    for entry in os.environ.get("AGENT_CONFIG_PREFETCH", "").split(","):
+        entry = entry.strip()
+        if entry:
+            keys.append(_config_cache_key(None, entry) if entry.lstrip("+").isdigit() else _config_cache_key(entry, None))
+    interval = float(os.environ.get("AGENT_CONFIG_REVALIDATE_SECONDS", "30"))
+    refresh_every = max(interval, cache.ttl / 2)
+
+    def _revalidate_loop() -> None:
+        since: str | None = None
+        refreshed_at = -math.inf
+        while True:
+            try:
+                if since is None:
+                    # Start from the server's clock, not ours, so skew can't hide an edit.
+                    since = _fetch_config_changes_sync("1970-01-01T00:00:00Z").get("now")
+                else:
+                    result = _fetch_config_changes_sync(since)
+                    since = result.get("now") or since
+                    changed = set(result.get("changed") or [])
+                    if changed:
+                        for key in cache.invalidate(changed):
+                            cache.load(key)  # refresh-ahead so the next call for this tenant is still a hit
+            except Exception as e:
+                logger.warning("Agent config revalidation failed: %s", e)
+            if time.monotonic() - refreshed_at >= refresh_every:
+                for key in keys:
+                    cache.load(key)
+                refreshed_at = time.monotonic()
+            time.sleep(interval)
+
+    threading.Thread(target=_revalidate_loop, name="agent-config-revalidate", daemon=True).start()
+
+
+def _dialed_number(participant: rtc.RemoteParticipant) -> str | None:
+    return participant.attributes.get("sip.trunkPhoneNumber") or None
+
+
+async def resolve_agent_config(ctx: JobContext, settings_name: str | None = None) -> dict:
+    """Resolve the tenant for this room and return its config, from the process cache when possible.
+
+    Organization comes from dispatch metadata (``organization_id``) or, for phone calls, the number
+    the caller dialed (SIP participant attribute ``sip.trunkPhoneNumber``). ``settings_name`` selects
+    the persona's livekit_agent_settings row.
+    """
+    organization_id = _job_metadata(ctx.job).get("organization_id")
+    dialed_number = None
+    if not organization_id:
+        await ctx.connect()
+        sip = [
+            p for p in ctx.room.remote_participants.values() if p.kind == rtc.ParticipantKind.PARTICIPANT_KIND_SIP
+        ]
+        if sip:
+            dialed_number = _dialed_number(sip[0])
+        elif ctx.room.name.startswith(("inbound-", "sip-", "outbound-")):
+            try:
+                participant = await asyncio.wait_for(
+                    ctx.wait_for_participant(kind=rtc.ParticipantKind.PARTICIPANT_KIND_SIP), timeout=5
+                )
+                dialed_number = _dialed_number(participant)
+            except asyncio.TimeoutError:
+                logger.warning("No SIP participant in %s; using default agent config", ctx.room.name)
+
+    key = _config_cache_key(organization_id, dialed_number, settings_name)
+    cache: AgentConfigCache | None = ctx.proc.userdata.get("config_cache")
+    if cache is None:
+        return await asyncio.to_thread(fetch_agent_config, organization_id, dialed_number, settings_name)
+    return await asyncio.to_thread(cache.get_or_load, key)
+
+
 def _send_sms_sync(url: str, token: str, room_name: str, body: str) -> tuple[bool, str]:
     """Blocking HTTP POST to agent-send-sms API. Returns (ok, message)."""
     try:
@@ -112,17 +481,1079 @@ def _send_sms_sync(url: str, token: str, room_name: str, body: str) -> tuple[boo
         return False, str(e)
 
 
+_KNOWLEDGE_KINDS = ("packages", "faqs", "venues")
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_DATE_RE = re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b")
+_STOPWORDS = frozenset(
+    "a an and are as at be do does for from how i in is it me my of on or the to what when where which with you your".split()
+)
+_EMBED_DIM = 512
+# Generic words that name a kind of entry rather than anything in it ("what are your prices").
+_KIND_TERMS = {
+    "packages": frozenset(
+        "package packages price prices pricing cost costs charge rate rates much quote service services offer".split()
+    ),
+    "faqs": frozenset("faq faqs question questions policy policies".split()),
+    "venues": frozenset("venue venues location locations place places hall halls".split()),
+}
+
+
+def _tokenize(text: str) -> list[str]:
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+
+def _embed(text: str) -> dict[int, float]:
+    """Hashed character-trigram embedding (unit-normalised sparse vector).
+
+    Cheap enough to compute per query in-process, and tolerant of the spelling
+    and word-form differences that STT transcripts introduce ("packages" vs "package").
+    """
+    vec: dict[int, float] = {}
+    for tok in _tokenize(text):
+        padded = f" {tok} "
+        for i in range(len(padded) - 2):
+            h = int.from_bytes(hashlib.blake2b(padded[i : i + 3].encode(), digest_size=4).digest(), "little")
+            vec[h % _EMBED_DIM] = vec.get(h % _EMBED_DIM, 0.0) + 1.0
+    norm = math.sqrt(sum(v * v for v in vec.values()))
+    if norm:
+        for k in vec:
+            vec[k] /= norm
+    return vec
+
+
+def _entry_text(kind: str, item: dict) -> str:
+    """Flatten a snapshot item into one line the agent can read back to the caller."""
+    if kind == "faqs":
+        return f"Q: {item.get('question', '')} A: {item.get('answer', '')}".strip()
+    parts = []
+    for key, value in item.items():
+        if key in ("id", "is_active", "display_order", "created_at", "updated_at") or value in (None, "", [], {}):
+            continue
+        if isinstance(value, (list, tuple)):
+            value = ", ".join(str(v) for v in value)
+        parts.append(f"{key.replace('_', ' ')}: {value}")
+    return "; ".join(parts)
+
+
+class KnowledgeIndex:
+    """In-memory index of one tenant's packages, FAQs, venues and booked dates.
+
+    Built per call from the tenant's snapshot (see KnowledgeStore), so lookups during a call
+    never touch the network.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._entries: dict[str, tuple[str, str, str]] = {}  # key -> (kind, text, searchable)
+        self._postings: dict[str, set[str]] = {}  # token -> keys
+        self._vectors: dict[str, dict[int, float]] = {}
+        self._booked_dates: set[str] = set()
+        self.has_calendar = False  # True once a snapshot carried booked_dates (even an empty list)
+        self.version: str | None = None
+
+    def __len__(self) -> int:
+        return len(self._entries) + len(self._booked_dates)
+
+    def apply(self, snapshot: dict) -> None:
+        """Replace the index contents with a full snapshot.
+
+        Snapshot shape: ``{"version", "packages": [...], "faqs": [...], "venues": [...],
+        "booked_dates": ["YYYY-MM-DD"]}``; deltas are folded in by merge_knowledge first.
+        """
+        entries: dict[str, tuple[str, str, str]] = {}
+        postings: dict[str, set[str]] = {}
+        vectors: dict[str, dict[int, float]] = {}
+        for kind in _KNOWLEDGE_KINDS:
+            for item in snapshot.get(kind) or []:
+                if not isinstance(item, dict) or item.get("is_active") is False:
+                    continue
+                item_id = _knowledge_item_id(item)
+                if not item_id:
+                    continue
+                key = f"{kind}:{item_id}"
+                # Index values only; field labels ("price", "name") would match every entry.
+                searchable = " ".join(str(v) for k, v in item.items() if k != "id" and isinstance(v, (str, list)))
+                entries[key] = (kind, _entry_text(kind, item), searchable)
+                for tok in set(_tokenize(searchable)):
+                    postings.setdefault(tok, set()).add(key)
+                vectors[key] = _embed(searchable)
+        with self._lock:
+            self._entries, self._postings, self._vectors = entries, postings, vectors
+            self._booked_dates = {str(d)[:10] for d in snapshot.get("booked_dates") or []}
+            self.has_calendar = "booked_dates" in snapshot
+            self.version = str(snapshot.get("version") or "")
+
+    def search(self, query: str, limit: int = 3) -> list[str]:
+        """Rank entries by keyword overlap plus trigram-embedding similarity.
+
+        Generic words ("prices", "packages", "venues") pick the entry kind; a query made only of
+        those lists that kind instead of matching nothing.
+        """
+        tokens = set(_tokenize(query))
+        kinds = {kind for kind, terms in _KIND_TERMS.items() if tokens & terms}
+        specific = {t for t in tokens if not any(t in terms for terms in _KIND_TERMS.values())}
+        qvec = _embed(" ".join(specific))
+        with self._lock:
+            candidates: dict[str, float] = {}
+            for tok in specific:
+                for key in self._postings.get(tok, ()):
+                    candidates[key] = candidates.get(key, 0.0) + 1.0
+            if not candidates and kinds:
+                return [text for kind, text, _ in self._entries.values() if kind in kinds][: max(limit, 5)]
+            if specific and len(candidates) < limit:
+                # Keyword miss (e.g. misheard word): fall back to scoring everything by embedding.
+                for key in self._entries:
+                    candidates.setdefault(key, 0.0)
+            scored = []
+            for key, hits in candidates.items():
+                vec = self._vectors[key]
+                sim = sum(w * vec.get(i, 0.0) for i, w in qvec.items())
+                score = hits / (len(specific) or 1) + sim + (0.5 if self._entries[key][0] in kinds else 0.0)
+                if score > 0.2:
+                    scored.append((score, self._entries[key][1]))
+        scored.sort(key=lambda s: s[0], reverse=True)
+        return [text for _, text in scored[:limit]]
+
+    def availability(self, date_iso: str) -> str:
+        """Describe a date's availability without claiming more than the calendar data supports."""
+        try:
+            date = datetime.date.fromisoformat(date_iso)
+        except ValueError:
+            return f"{date_iso}: not a valid date"
+        if date < datetime.date.today():
+            return f"{date_iso}: that date has already passed"
+        with self._lock:
+            if not self.has_calendar:
+                return f"{date_iso}: availability unknown (no calendar data); offer to have the team confirm"
+            if date_iso in self._booked_dates:
+                return f"{date_iso}: already booked"
+        return f"{date_iso}: open on the calendar (not held until booked)"
+
+
+def _knowledge_item_id(item: dict) -> str | None:
+    item_id = item.get("id") or item.get("name") or item.get("title") or item.get("question")
+    return str(item_id) if item_id else None
+
+
+def merge_knowledge(base: dict | None, delta: dict) -> dict:
+    """Fold an agent-knowledge response into a tenant's stored full snapshot.
+
+    A full response replaces ``base``. A delta (``full`` false) upserts its changed rows, keeps only
+    the ids listed under ``ids`` (so deleted or deactivated rows drop out) and replaces booked_dates.
+    """
+    if base is None or delta.get("full", True):
+        return {**delta, "full": True}
+    merged = {**base, "version": delta.get("version", base.get("version"))}
+    ids = delta.get("ids") or {}
+    for kind in _KNOWLEDGE_KINDS:
+        items = {}
+        for item in [*(base.get(kind) or []), *(delta.get(kind) or [])]:
+            if isinstance(item, dict) and _knowledge_item_id(item):
+                items[_knowledge_item_id(item)] = item
+        if kind in ids:
+            keep = {str(i) for i in ids[kind] or []}
+            items = {k: v for k, v in items.items() if k in keep}
+        merged[kind] = list(items.values())
+    if "booked_dates" in delta:
+        merged["booked_dates"] = delta["booked_dates"]
+    return merged
+
+
+def _fetch_knowledge_sync(url: str, token: str, organization_id: str | None, since: str | None) -> dict:
+    """Blocking GET of a tenant's knowledge snapshot (or delta when ``since`` is set)."""
+    params = {k: v for k, v in (("organization_id", organization_id), ("since", since)) if v}
+    if params:
+        url = f"{url}{'&' if '?' in url else '?'}{urllib.parse.urlencode(params)}"
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    req = urllib.request.Request(url, headers=headers)
+    with urllib.request.urlopen(req, timeout=15) as resp:
+        return json.loads(resp.read().decode())
+
+
+class KnowledgeStore:
+    """Per-tenant knowledge snapshots, stored on disk under AGENT_KNOWLEDGE_DIR.
+
+    Keys follow _config_cache_key (``org:<id>``, or ``default`` for M10), so a call only ever sees
+    its own organization's packages, venues and calendar. Job processes live for one call: they
+    build a KnowledgeIndex from the tenant's file, and the long-lived main worker process keeps the
+    files current with ``since`` deltas (see start_knowledge_refresh).
+    """
+
+    def __init__(self, store_dir: str, url: str = "", token: str = "", path: str = "") -> None:
+        self.store_dir = store_dir
+        self.url = url
+        self.token = token
+        self.path = path  # AGENT_KNOWLEDGE_FILE, the default tenant's snapshot without (or before) the URL
+
+    @classmethod
+    def from_env(cls) -> "KnowledgeStore | None":
+        url = os.environ.get("AGENT_KNOWLEDGE_URL", "").rstrip("/")
+        path = os.environ.get("AGENT_KNOWLEDGE_FILE", "")
+        if not url and not path:
+            return None
+        return cls(
+            os.environ.get("AGENT_KNOWLEDGE_DIR") or os.path.join(tempfile.gettempdir(), "ben-agent-knowledge"),
+            url=url,
+            token=os.environ.get("AGENT_KNOWLEDGE_TOKEN") or os.environ.get("LIVEKIT_AGENT_CONFIG_TOKEN", ""),
+            path=path,
+        )
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.store_dir, hashlib.sha1(key.encode()).hexdigest() + ".json")
+
+    def get(self, key: str) -> dict | None:
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                return json.load(f).get("snapshot")
+        except (OSError, ValueError, AttributeError):
+            return None
+
+    def put(self, key: str, snapshot: dict) -> None:
+        try:
+            os.makedirs(self.store_dir, exist_ok=True)
+            path = self._path(key)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"key": key, "snapshot": snapshot}, f)
+            os.replace(tmp, path)  # atomic, so job processes never read a partial file
+        except OSError as e:
+            logger.warning("Failed to store knowledge snapshot: %s", e)
+
+    def keys(self) -> list[str]:
+        try:
+            names = [n for n in os.listdir(self.store_dir) if n.endswith(".json")]
+        except OSError:
+            return []
+        keys = []
+        for name in names:
+            try:
+                with open(os.path.join(self.store_dir, name), encoding="utf-8") as f:
+                    keys.append(json.load(f)["key"])
+            except (OSError, ValueError, KeyError, TypeError):
+                continue
+        return keys
+
+    def _read_file(self) -> dict | None:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return {**json.load(f), "full": True}
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning("Failed to load knowledge file %s: %s", self.path, e)
+            return None
+
+    def refresh(self, key: str) -> dict | None:
+        """Blocking: fetch the tenant's delta (full snapshot the first time), fold it in and store it."""
+        base = self.get(key)
+        if not self.url:
+            return base
+        kind, _, organization_id = key.partition(":")
+        since = (base or {}).get("version") or None
+        snapshot = merge_knowledge(
+            base, _fetch_knowledge_sync(self.url, self.token, organization_id if kind == "org" else None, since)
+        )
+        self.put(key, snapshot)
+        return snapshot
+
+    def index_for(self, organization_id: str | None) -> KnowledgeIndex:
+        """Blocking (run off the event loop): build the index for a call to this organization.
+
+        A tenant with no snapshot on disk yet gets an empty index that fills in on a background
+        thread; until then lookup_business_info says the info is unavailable.
+        """
+        key = _config_cache_key(organization_id, None)
+        index = KnowledgeIndex()
+        snapshot = self.get(key)
+        if snapshot is not None:
+            index.apply(snapshot)
+            return index
+        if key == "default" and self.path:
+            seed = self._read_file()
+            if seed is not None:
+                index.apply(seed)
+                if not self.url:
+                    self.put(key, seed)
+        if not self.url:
+            return index
+
+        def _load() -> None:
+            try:
+                fetched = self.refresh(key)
+            except Exception as e:
+                logger.warning("Failed to fetch knowledge snapshot for %s: %s", key, e)
+                return
+            if fetched is not None:
+                index.apply(fetched)
+            logger.info("Knowledge index for %s loaded: %d entries (version %s)", key, len(index), index.version)
+
+        threading.Thread(target=_load, name="knowledge-load", daemon=True).start()
+        return index
+
+
+def start_knowledge_refresh(store: KnowledgeStore | None) -> None:
+    """Run in the main worker process: keep every tenant's snapshot current with ``since`` deltas.
+
+    Covers the default tenant, organization ids in AGENT_CONFIG_PREFETCH and every tenant a job
+    process has fetched since (its file is on disk). Runs on a daemon thread, off worker start.
+    """
+    if store is None or not store.url:
+        return
+    keys = {_config_cache_key(None, None)}
+    for entry in os.environ.get("AGENT_CONFIG_PREFETCH", "").split(","):
+        entry = entry.strip()
+        if entry and not entry.lstrip("+").isdigit():
+            keys.add(_config_cache_key(entry, None))
+    interval = float(os.environ.get("AGENT_KNOWLEDGE_REFRESH_SECONDS", "300"))
+
+    def _refresh_loop() -> None:
+        while True:
+            for key in sorted(keys | set(store.keys())):
+                try:
+                    store.refresh(key)
+                except Exception as e:
+                    logger.warning("Knowledge refresh for %s failed: %s", key, e)
+            time.sleep(interval)
+
+    threading.Thread(target=_refresh_loop, name="knowledge-refresh", daemon=True).start()
+
+
+_SUMMARY_ITEM_ID = "ben_context_summary"
+_NOTES_ITEM_ID = "ben_context_notes"
+_SUMMARY_PROMPT = (
+    "You maintain a running summary of a phone call between a caller and M10 DJ Company's voice assistant. "
+    "Merge the new conversation into the current summary. Keep every concrete detail the caller gave "
+    "(names, event type, date, venue, guest count, budget, music preferences, decisions, open questions) "
+    "and drop small talk. Reply with the updated summary only, in plain sentences, under 200 words."
+)
+_PHONE_RE = re.compile(r"(?:\+?1[\s.-]?)?\(?\b\d{3}\)?[\s.-]?\d{3}[\s.-]?\d{4}\b")
+_BUDGET_RE = re.compile(r"\$\s?\d+(?:,\d{3})*(?:\.\d{2})?|\b\d+(?:,\d{3})*\s?(?:dollars|bucks)\b", re.I)
+_EVENT_DATE_RE = re.compile(
+    r"\b(?:jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\.?\s+\d{1,2}(?:st|nd|rd|th)?(?:,?\s+\d{4})?\b"
+    r"|\b\d{1,2}/\d{1,2}(?:/\d{2,4})?\b|\b\d{4}-\d{2}-\d{2}\b",
+    re.I,
+)
+_TOOL_OUTPUT_KEEP_CHARS = 600  # tool outputs are cut to this when the context is over budget
+_VENUE_RE = re.compile(r"(?i:venue is|venue called|held at|at the)\s+([A-Z0-9][\w'&-]*(?:\s+[A-Z0-9][\w'&-]*){0,5})")
+
+
+def _item_text(item) -> str:
+    text = getattr(item, "text_content", None)
+    if text is None:
+        text = getattr(item, "arguments", None) or getattr(item, "output", None) or ""
+    return str(text)
+
+
+class ConversationContext:
+    """Keeps the LLM chat context bounded on long calls.
+
+    The instruction prefix is never touched (so provider prompt caching keeps hitting), the last
+    ``keep_turns`` user turns stay verbatim, and older turns are folded into a running summary by a
+    background task. Key facts (date, venue, phone, budget) are pinned as a structured note.
+    ``max_tokens`` is a hard cap: past it, long tool outputs are truncated and then the oldest
+    turns dropped, still going to the summarizer.
+
+    The context is only rewritten when the agent finishes speaking, never inside
+    on_user_turn_completed, so a preemptive reply is not invalidated by compaction.
+    """
+
+    def __init__(self, keep_turns: int = 6, max_tokens: int = 6000, summary_model: str = "openai/gpt-4.1-mini") -> None:
+        self.keep_turns = max(1, keep_turns)
+        self.max_tokens = max_tokens
+        self.summary_model = summary_model
+        self.notes: dict[str, str] = {}
+        self._summary = ""
+        self._summarized_ids: set[str] = set()
+        self._pending_ids: set[str] = set()  # batch held by the running summary task
+        self._evicted: dict[str, object] = {}  # items dropped for budget, restored if their summary fails
+        self._originals: dict[str, object] = {}  # full tool outputs whose context copy was truncated
+        self._task: asyncio.Task | None = None
+        self._llm = None
+        self._agent: Agent | None = None
+        self._session: AgentSession | None = None
+
+    def pin_facts(self, text: str) -> None:
+        for key, pattern in (("event date", _EVENT_DATE_RE), ("phone", _PHONE_RE), ("budget", _BUDGET_RE)):
+            match = pattern.search(text)
+            if match:
+                self.notes[key] = match.group(0).strip()
+        match = _VENUE_RE.search(text)
+        if match:
+            self.notes["venue"] = match.group(1).strip()
+
+    @staticmethod
+    def _estimate_tokens(items) -> int:
+        return sum(len(_item_text(i)) // 4 + 4 for i in items)
+
+    def _context_items(self) -> list:
+        items = []
+        if self._summary:
+            items.append(
+                llm.ChatMessage(role="system", id=_SUMMARY_ITEM_ID, content=[f"Summary of the call so far: {self._summary}"])
+            )
+        if self.notes:
+            notes = "; ".join(f"{k}: {v}" for k, v in sorted(self.notes.items()))
+            items.append(llm.ChatMessage(role="system", id=_NOTES_ITEM_ID, content=[f"Pinned call notes: {notes}"]))
+        return items
+
+    def attach(self, session: AgentSession, agent: Agent) -> None:
+        self._session = session
+        self._agent = agent
+        session.on("agent_state_changed", self._on_agent_state_changed)
+
+    def _on_agent_state_changed(self, ev) -> None:
+        # Between the agent's reply and the caller's next turn nothing is generating, so rewriting
+        # the context here costs no latency and cannot throw away a preemptive reply.
+        if ev.old_state == "speaking" and ev.new_state == "listening" and self._agent is not None:
+            asyncio.create_task(self.compact(self._agent))
+
+    async def compact(self, agent: Agent) -> None:
+        """Start summarizing aged-out turns and persist the compacted context on the agent."""
+        items = list(agent.chat_ctx.items)
+        prefix_len = 0
+        while (
+            prefix_len < len(items)
+            and getattr(items[prefix_len], "role", None) in ("system", "developer")
+            and items[prefix_len].id not in (_SUMMARY_ITEM_ID, _NOTES_ITEM_ID)
+        ):
+            prefix_len += 1
+        prefix = items[:prefix_len]
+        body = [i for i in items[prefix_len:] if i.id not in (_SUMMARY_ITEM_ID, _NOTES_ITEM_ID)]
+
+        user_idx = [n for n, i in enumerate(body) if getattr(i, "role", None) == "user"]
+        cut = user_idx[-self.keep_turns] if len(user_idx) > self.keep_turns else 0
+        # Items evicted for budget whose summary failed come back first; they are the oldest.
+        old = [i for i in self._evicted.values() if i.id not in self._pending_ids] + body[:cut]
+        old = [i for i in old if i.id not in self._summarized_ids]
+        recent = body[cut:]
+
+        unsummarized = [i for i in old if i.id not in self._pending_ids]
+        if unsummarized and (self._task is None or self._task.done()):
+            self._pending_ids = {i.id for i in unsummarized}
+            self._task = asyncio.create_task(self._summarize([self._originals.get(i.id, i) for i in unsummarized]))
+
+        compacted = prefix + self._context_items() + old + recent
+        if self._estimate_tokens(compacted) > self.max_tokens:
+            # Over budget: drop only the batch the summarizer already holds. Anything that aged out
+            # after that batch was taken stays verbatim until a later batch picks it up.
+            for i in old:
+                if i.id in self._pending_ids:
+                    self._evicted[i.id] = i
+            old = [i for i in old if i.id not in self._pending_ids]
+            compacted = prefix + self._context_items() + old + recent
+        if self._estimate_tokens(compacted) > self.max_tokens:
+            compacted = prefix + self._fit_budget(prefix, self._context_items(), old + recent)
+        if [(i.id, _item_text(i)) for i in compacted] == [(i.id, _item_text(i)) for i in items]:
+            return
+        await agent.update_chat_ctx(llm.ChatContext(list(compacted)))
+
+    def _fit_budget(self, prefix: list, ours: list, body: list) -> list:
+        """Hard cap: truncate tool outputs, then drop the oldest items until the estimate fits.
+
+        The prefix and the summary/notes items are never touched. Dropped items wait in _evicted and
+        full tool outputs in _originals, so the summarizer still sees everything that left the context.
+        """
+        budget = self.max_tokens - self._estimate_tokens(prefix) - self._estimate_tokens(ours)
+        body = list(body)
+        for n, item in enumerate(body):
+            if self._estimate_tokens(body) <= budget:
+                break
+            output = getattr(item, "output", None)
+            if isinstance(output, str) and len(output) > _TOOL_OUTPUT_KEEP_CHARS:
+                self._originals.setdefault(item.id, item)
+                body[n] = item.model_copy(update={"output": output[:_TOOL_OUTPUT_KEEP_CHARS] + " ...[truncated]"})
+        while len(body) > 1 and self._estimate_tokens(body) > budget:
+            dropped = body.pop(0)
+            # A tool call and its output leave together; the provider rejects one without the other.
+            call_id = getattr(dropped, "call_id", None)
+            group = [dropped] + [i for i in body if call_id and getattr(i, "call_id", None) == call_id]
+            body = [i for i in body if i not in group]
+            for i in group:
+                if i.id not in self._summarized_ids:
+                    self._evicted[i.id] = self._originals.get(i.id, i)
+        return ours + body
+
+    async def _summarize(self, items: list) -> None:
+        try:
+            summary = await self._generate_summary(items)
+        except Exception as e:
+            # Keep the batch: its items are still in the context or held in _evicted, and the next
+            # compaction retries them.
+            logger.warning("Context summary failed: %s", e)
+            return
+        finally:
+            self._pending_ids = set()
+        if summary is not None:
+            self._summary = summary or self._summary
+            ids = {i.id for i in items}
+            self._summarized_ids.update(ids)
+            for item_id in ids:
+                self._evicted.pop(item_id, None)
+                self._originals.pop(item_id, None)
+
+    async def _generate_summary(self, items: list) -> str | None:
+        """Return the merged summary ("" when there was nothing to add), or None if the model returned nothing."""
+        transcript = "\n".join(
+            f"{getattr(i, 'role', None) or getattr(i, 'type', 'item')}: {_item_text(i)}" for i in items if _item_text(i)
+        )
+        if not transcript:
+            return ""
+        if self._llm is None:
+            self._llm = inference.LLM(model=self.summary_model)
+        chat_ctx = llm.ChatContext.empty()
+        chat_ctx.add_message(role="system", content=_SUMMARY_PROMPT)
+        chat_ctx.add_message(
+            role="user",
+            content=f"Current summary:\n{self._summary or '(none)'}\n\nNew conversation:\n{transcript}",
+        )
+        parts: list[str] = []
+        async with self._llm.chat(chat_ctx=chat_ctx) as stream:
+            async for chunk in stream:
+                if chunk.delta and chunk.delta.content:
+                    parts.append(chunk.delta.content)
+        return "".join(parts).strip() or None
+
+    async def aclose(self) -> None:
+        if self._session is not None:
+            self._session.off("agent_state_changed", self._on_agent_state_changed)
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+
+def _post_gzip_sync(url: str, token: str, payload: bytes) -> bool:
+    """Blocking POST of a gzip-compressed JSON batch. Returns False when it should be retried later."""
+    try:
+        req = urllib.request.Request(
+            url,
+            data=payload,
+            headers={
+                "Authorization": f"Bearer {token}",
+                "Content-Type": "application/json",
+                "Content-Encoding": "gzip",
+            },
+            method="POST",
+        )
+        with urllib.request.urlopen(req, timeout=15) as resp:
+            return 200 <= resp.status < 300
+    except urllib.error.HTTPError as e:
+        if 400 <= e.code < 500 and e.code not in (401, 403, 408, 429):
+            # The endpoint rejected this batch itself; resending it would fail the same way.
+            logger.warning("Event export batch rejected (%s); dropping it", e.code)
+            return True
+        logger.warning("Event export POST failed: %s", e)
+        return False
+    except Exception as e:
+        logger.warning("Event export POST failed: %s", e)
+        return False
+
+
+_SPOOL_CLAIM_STALE_SECONDS = 120
+
+
+class EventExporter:
+    """Collects transcripts, tool calls and latency metrics for one call into a ring buffer.
+
+    Session event handlers only append to the buffer; a background task ships gzip batches to
+    AGENT_EVENTS_URL when ``batch_size`` events are waiting or every ``flush_seconds``, and once
+    more at session close. Batches that cannot be delivered are spooled to disk and retried later.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        token: str,
+        room_name: str,
+        job_id: str,
+        batch_size: int = 50,
+        flush_seconds: float = 5.0,
+        max_buffer: int = 2000,
+        spool_dir: str = "",
+        spool_max_bytes: int = 50 * 1024 * 1024,
+    ) -> None:
+        self.url = url
+        self.token = token
+        self.room_name = room_name
+        self.job_id = job_id
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.spool_dir = spool_dir or os.path.join(tempfile.gettempdir(), "ben-agent-events")
+        self.spool_max_bytes = spool_max_bytes
+        self.dropped = 0
+        self._buffer: collections.deque = collections.deque(maxlen=max_buffer)
+        self._seq = 0
+        self._wake = asyncio.Event()
+        self._closing = False
+        self._task: asyncio.Task | None = None
+
+    @classmethod
+    def from_env(cls, room_name: str, job_id: str) -> "EventExporter | None":
+        url = os.environ.get("AGENT_EVENTS_URL", "").rstrip("/")
+        token = os.environ.get("AGENT_EVENTS_TOKEN") or os.environ.get("LIVEKIT_AGENT_CONFIG_TOKEN", "")
+        if not url or not token:
+            return None
+        return cls(
+            url,
+            token,
+            room_name,
+            job_id,
+            batch_size=int(os.environ.get("AGENT_EVENTS_BATCH_SIZE", "50")),
+            flush_seconds=float(os.environ.get("AGENT_EVENTS_FLUSH_SECONDS", "5")),
+            spool_dir=os.environ.get("AGENT_EVENTS_SPOOL_DIR", ""),
+            spool_max_bytes=int(float(os.environ.get("AGENT_EVENTS_SPOOL_MAX_MB", "50")) * 1024 * 1024),
+        )
+
+    def record(self, kind: str, **data) -> None:
+        if len(self._buffer) == self._buffer.maxlen:
+            self.dropped += 1
+        self._seq += 1
+        self._buffer.append({"type": kind, "ts": time.time(), "seq": self._seq, **data})
+        if len(self._buffer) >= self.batch_size:
+            self._wake.set()
+
+    def attach(self, session: AgentSession) -> None:
+        @session.on("conversation_item_added")
+        def _on_item(ev) -> None:
+            item = ev.item
+            self.record(
+                "transcript",
+                role=getattr(item, "role", None),
+                text=_item_text(item),
+                interrupted=bool(getattr(item, "interrupted", False)),
+            )
+            # Per-turn latency (ttft, ttfb, end-of-turn delay, ...) is reported on the message itself.
+            metrics = getattr(item, "metrics", None) or {}
+            latency = {k: v for k, v in dict(metrics).items() if isinstance(v, (int, float))}
+            if latency:
+                self.record("latency", role=getattr(item, "role", None), **latency)
+
+        @session.on("function_tools_executed")
+        def _on_tools(ev) -> None:
+            for call, output in zip(ev.function_calls, ev.function_call_outputs):
+                self.record(
+                    "tool_call",
+                    name=call.name,
+                    arguments=call.arguments,
+                    output=(output.output if output else "")[:2000],
+                    is_error=bool(output and output.is_error),
+                )
+
+        @session.on("close")
+        def _on_close(ev) -> None:
+            reason = getattr(ev, "reason", None)
+            self.record("session_closed", reason=str(getattr(reason, "value", reason)))
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                # Keep the flush loop alive for the rest of the call.
+                logger.warning("Event export flush failed: %s", e)
+
+    async def flush(self) -> None:
+        if not self._buffer:
+            return
+        events = [self._buffer.popleft() for _ in range(len(self._buffer))]
+        payload = gzip.compress(
+            json.dumps(
+                {"room": self.room_name, "job_id": self.job_id, "dropped": self.dropped, "events": events}
+            ).encode("utf-8")
+        )
+        if await asyncio.to_thread(_post_gzip_sync, self.url, self.token, payload):
+            await asyncio.to_thread(self._drain_spool)
+        else:
+            await asyncio.to_thread(self._spool, payload)
+
+    def _spool(self, payload: bytes) -> None:
+        try:
+            os.makedirs(self.spool_dir, exist_ok=True)
+            path = os.path.join(self.spool_dir, f"{self.job_id or 'job'}-{time.time_ns()}.json.gz")
+            with open(path, "wb") as f:
+                f.write(payload)
+        except OSError as e:
+            logger.warning("Failed to spool agent events: %s", e)
+            return
+        self._trim_spool()
+
+    def _trim_spool(self) -> None:
+        """Drop the oldest spooled batches once the spool is over spool_max_bytes (long outages)."""
+        try:
+            paths = [os.path.join(self.spool_dir, n) for n in os.listdir(self.spool_dir) if n.endswith(".json.gz")]
+            stats = {p: os.stat(p) for p in paths}
+        except OSError:
+            return
+        sizes = {p: st.st_size for p, st in stats.items()}
+        total = sum(sizes.values())
+        for path in sorted(sizes, key=lambda p: stats[p].st_mtime):
+            if total <= self.spool_max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= sizes[path]
+            logger.warning("Agent event spool over %d bytes; dropped %s", self.spool_max_bytes, os.path.basename(path))
+
+    def _drain_spool(self, limit: int = 10) -> None:
+        """Resend spooled batches (from any job in this worker) now that the endpoint is reachable."""
+        try:
+            names = os.listdir(self.spool_dir)
+        except OSError:
+            return
+        for name in names:
+            # A claim older than any POST can take belongs to a process that died mid-send:
+            # rename it back (atomic, so only one job wins) and let it be claimed again below.
+            if not name.endswith(".json.gz.sending"):
+                continue
+            claimed = os.path.join(self.spool_dir, name)
+            try:
+                if time.time() - os.path.getmtime(claimed) > _SPOOL_CLAIM_STALE_SECONDS:
+                    os.replace(claimed, claimed[: -len(".sending")])
+            except OSError:
+                pass
+        try:
+            names = sorted(n for n in os.listdir(self.spool_dir) if n.endswith(".json.gz"))[:limit]
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.spool_dir, name)
+            claimed = f"{path}.sending"
+            try:
+                os.replace(path, claimed)  # claim it so concurrent jobs don't double-send
+                os.utime(claimed)  # claim time, for the stale-claim check above
+                with open(claimed, "rb") as f:
+                    payload = f.read()
+            except OSError:
+                continue
+            sent = _post_gzip_sync(self.url, self.token, payload)
+            try:
+                if sent:
+                    os.remove(claimed)
+                else:
+                    os.replace(claimed, path)
+            except OSError as e:
+                logger.warning("Failed to update spooled batch %s: %s", name, e)
+            if not sent:
+                return
+
+    async def aclose(self) -> None:
+        # Let an in-flight flush finish instead of cancelling it, so no popped batch is lost.
+        self._closing = True
+        self._wake.set()
+        if self._task is not None:
+            await self._task
+        await self.flush()
+
+
+# Path fragments used to attribute tracemalloc growth to voice-pipeline components.
+_DIAG_COMPONENTS = (
+    ("noise_cancellation", ("noise_cancellation",)),
+    ("background_audio", ("background_audio",)),
+    ("turn_detector", ("turn_detector",)),
+    ("vad", ("silero", "/vad")),
+    ("stt", ("/stt", "assemblyai", "deepgram")),
+    ("tts", ("/tts", "elevenlabs", "cartesia")),
+    ("llm", ("/llm", "openai")),
+)
+
+
+_DIAG_TRACEMALLOC_FRAMES = 25  # deep enough to reach the plugin frame under livekit/asyncio/numpy frames
+
+
+def _diag_component(filename: str) -> str:
+    path = filename.replace("\\", "/").lower()
+    for component, fragments in _DIAG_COMPONENTS:
+        if any(f in path for f in fragments):
+            return component
+    return "other"
+
+
+def _diag_traceback_component(tb: tracemalloc.Traceback) -> str:
+    """Credit an allocation to the innermost frame that belongs to a known component."""
+    for frame in reversed(tb):  # tracemalloc orders frames oldest first
+        component = _diag_component(frame.filename)
+        if component != "other":
+            return component
+    return "other"
+
+
+def _tracemalloc_growth(start: tracemalloc.Snapshot) -> tuple[dict[str, int], list[str]]:
+    """Blocking: snapshot now and attribute the growth since ``start`` (bytes per component, top sites)."""
+    diffs = tracemalloc.take_snapshot().compare_to(start, "traceback")
+    by_component: dict[str, int] = {}
+    for diff in diffs:
+        component = _diag_traceback_component(diff.traceback)
+        by_component[component] = by_component.get(component, 0) + diff.size_diff
+    top = [
+        f"{d.traceback[-1].filename}:{d.traceback[-1].lineno} ({_diag_traceback_component(d.traceback)}): "
+        f"{d.size_diff // 1024} KiB"
+        for d in diffs[:5]
+        if d.size_diff > 0
+    ]
+    return by_component, top
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except Exception:
+        return 0
+
+
+class Diagnostics:
+    """Opt-in per-process memory and event-loop health instrumentation (AGENT_DIAGNOSTICS).
+
+    Takes RSS (and, in "tracemalloc" mode, allocation) snapshots at job start and end and attributes
+    the growth to STT/TTS/VAD/noise cancellation/background audio. tracemalloc only sees Python
+    allocations: the native noise-cancellation and VAD/turn-detector model memory shows up in RSS
+    only, which is what ``rss_untraced_delta_kb`` isolates. A heartbeat task measures loop
+    lag while a watchdog thread captures the loop thread's stack whenever it is blocked, so
+    synchronous calls on the loop show up by name.
+
+    The long-lived main worker process (``main=True``) serves the stable endpoint on
+    127.0.0.1:AGENT_DIAGNOSTICS_PORT with its own RSS history and loop health plus the reports of
+    recent jobs, which job processes write to AGENT_DIAGNOSTICS_DIR. Each job process also serves
+    its live state on the next free port above it; that endpoint is temporary and disappears when
+    the job's process exits.
+    """
+
+    def __init__(self, use_tracemalloc: bool, lag_threshold: float, port: int, reports_dir: str, main: bool) -> None:
+        self.use_tracemalloc = use_tracemalloc
+        self.lag_threshold = lag_threshold
+        self.port = port
+        self.reports_dir = reports_dir
+        self.main = main
+        self.rss_history: collections.deque = collections.deque(maxlen=1440)  # main: one sample a minute
+        self.max_lag = 0.0
+        self.job_max_lag = 0.0
+        self.stalls = 0
+        self.jobs: collections.deque = collections.deque(maxlen=50)
+        self.blocking_calls: collections.deque = collections.deque(maxlen=20)
+        self._beat = time.perf_counter()
+        self._loop_thread_id: int | None = None
+        self._reported_beat = 0.0
+
+    @classmethod
+    def from_env(cls, main: bool = False) -> "Diagnostics | None":
+        mode = os.environ.get("AGENT_DIAGNOSTICS", "").strip().lower()
+        if mode in ("", "0", "false", "off"):
+            return None
+        diagnostics = cls(
+            # The main process runs no pipelines, so tracing it would only slow it down.
+            use_tracemalloc=mode == "tracemalloc" and not main,
+            lag_threshold=float(os.environ.get("AGENT_DIAGNOSTICS_LAG_MS", "100")) / 1000,
+            port=int(os.environ.get("AGENT_DIAGNOSTICS_PORT", "8090")),
+            reports_dir=os.environ.get("AGENT_DIAGNOSTICS_DIR")
+            or os.path.join(tempfile.gettempdir(), "ben-agent-diagnostics"),
+            main=main,
+        )
+        if diagnostics.use_tracemalloc and not tracemalloc.is_tracing():
+            tracemalloc.start(_DIAG_TRACEMALLOC_FRAMES)
+        diagnostics._serve()
+        if main:
+            threading.Thread(target=diagnostics._sample_rss, name="agent-rss-sampler", daemon=True).start()
+        return diagnostics
+
+    def _sample_rss(self, interval: float = 60.0) -> None:
+        while True:
+            self.rss_history.append((round(time.time()), _rss_bytes() // 1024))
+            time.sleep(interval)
+
+    def _serve(self) -> None:
+        diagnostics = self
+
+        class _Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                body = json.dumps(diagnostics.report(), default=str).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args) -> None:
+                pass
+
+        # The main process owns the base port; each job process takes the first free port above it.
+        ports = [self.port] if self.main else range(self.port + 1, self.port + 33)
+        for port in ports:
+            try:
+                httpd = http.server.ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+            except OSError:
+                continue
+            self.port = port
+            threading.Thread(target=httpd.serve_forever, name="agent-diagnostics", daemon=True).start()
+            logger.info("Diagnostics endpoint on http://127.0.0.1:%d (pid %d)", port, os.getpid())
+            return
+        logger.warning("No free port for diagnostics endpoint near %d", self.port)
+
+    def ensure_loop_monitor(self) -> None:
+        if self._loop_thread_id is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        asyncio.get_running_loop().create_task(self._heartbeat())
+        threading.Thread(target=self._watchdog, name="agent-loop-watchdog", daemon=True).start()
+
+    async def _heartbeat(self, interval: float = 0.05) -> None:
+        while True:
+            start = time.perf_counter()
+            self._beat = start
+            await asyncio.sleep(interval)
+            lag = time.perf_counter() - start - interval
+            self.max_lag = max(self.max_lag, lag)
+            self.job_max_lag = max(self.job_max_lag, lag)
+            if lag > self.lag_threshold:
+                self.stalls += 1
+
+    def _watchdog(self) -> None:
+        while True:
+            time.sleep(self.lag_threshold / 2)
+            beat = self._beat
+            if time.perf_counter() - beat < self.lag_threshold + 0.05 or beat == self._reported_beat:
+                continue
+            self._reported_beat = beat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = traceback.format_stack(frame, limit=8)
+            self.blocking_calls.append({"at": time.time(), "stack": stack})
+            logger.warning("Event loop blocked > %.0f ms in:\n%s", self.lag_threshold * 1000, "".join(stack[-3:]))
+
+    async def job_started(self, job_id: str) -> dict:
+        self.ensure_loop_monitor()
+        self.job_max_lag = 0.0
+        start = {
+            "job_id": job_id,
+            "started_at": time.time(),
+            "rss": _rss_bytes(),
+            "stalls": self.stalls,
+            "blocking_calls": len(self.blocking_calls),
+            "snapshot": None,
+        }
+        if self.use_tracemalloc:
+            # take_snapshot walks every live allocation; keep that off the loop.
+            start["snapshot"] = await asyncio.to_thread(tracemalloc.take_snapshot)
+        return start
+
+    async def job_finished(self, start: dict) -> None:
+        report = {
+            "job_id": start["job_id"],
+            "duration_s": round(time.time() - start["started_at"], 1),
+            "rss_delta_kb": (_rss_bytes() - start["rss"]) // 1024,
+            "rss_kb": _rss_bytes() // 1024,
+            "loop_stalls": self.stalls - start["stalls"],
+            "blocking_calls": len(self.blocking_calls) - start["blocking_calls"],
+            "max_loop_lag_ms": round(self.job_max_lag * 1000, 1),
+        }
+        if start["snapshot"] is not None:
+            by_component, top = await asyncio.to_thread(_tracemalloc_growth, start["snapshot"])
+            report["tracemalloc_delta_kb"] = {k: v // 1024 for k, v in sorted(by_component.items())}
+            report["rss_untraced_delta_kb"] = report["rss_delta_kb"] - sum(by_component.values()) // 1024
+            report["top_growth"] = top
+        report["pid"] = os.getpid()
+        self.jobs.append(report)
+        logger.info("Job diagnostics: %s", json.dumps(report))
+        # Hand the report to the main process; this process exits with the job.
+        try:
+            os.makedirs(self.reports_dir, exist_ok=True)
+            path = os.path.join(self.reports_dir, f"{time.time_ns()}-{os.getpid()}.json")
+            with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+                json.dump(report, f)
+            os.replace(f"{path}.tmp", path)
+        except OSError as e:
+            logger.warning("Failed to write job diagnostics: %s", e)
+
+    def _collect_job_reports(self, keep: int = 50) -> list[dict]:
+        try:
+            names = sorted((n for n in os.listdir(self.reports_dir) if n.endswith(".json")), reverse=True)
+        except OSError:
+            return []
+        reports = []
+        for name in names[:keep]:
+            try:
+                with open(os.path.join(self.reports_dir, name), encoding="utf-8") as f:
+                    reports.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        for name in names[keep:]:
+            try:
+                os.remove(os.path.join(self.reports_dir, name))
+            except OSError:
+                pass
+        return reports
+
+    def report(self) -> dict:
+        report = {
+            "pid": os.getpid(),
+            "process": "main" if self.main else "job",
+            "rss_kb": _rss_bytes() // 1024,
+            "tracemalloc": self.use_tracemalloc,
+            "loop_stalls": self.stalls,
+            "max_loop_lag_ms": round(self.max_lag * 1000, 1),
+            "blocking_calls": list(self.blocking_calls),
+        }
+        if self.main:
+            report["rss_history_kb"] = list(self.rss_history)
+            report["jobs"] = self._collect_job_reports()
+        else:
+            report["jobs"] = list(self.jobs)
+        return report
+
+
+def _tool_name(tool) -> str:
+    info = getattr(tool, "info", None)
+    return getattr(info, "name", None) or getattr(tool, "__name__", "")
+
+
 class DefaultAgent(Agent):
-    def __init__(self, instructions: str, greeting_text: str) -> None:
+    def __init__(
+        self,
+        instructions: str,
+        greeting_text: str,
+        knowledge: KnowledgeIndex | None = None,
+        allowed_tools: list[str] | None = None,
+    ) -> None:
         super().__init__(instructions=instructions)
+        self._knowledge = knowledge
+        self._allowed_tools = allowed_tools
+        self._context = ConversationContext(
+            keep_turns=int(os.environ.get("AGENT_CONTEXT_KEEP_TURNS", "6")),
+            max_tokens=int(os.environ.get("AGENT_CONTEXT_MAX_TOKENS", "6000")),
+            summary_model=os.environ.get("AGENT_CONTEXT_SUMMARY_MODEL", "openai/gpt-4.1-mini"),
+        )
 
     async def on_enter(self):
+        self._context.attach(self.session, self)
+        if self._allowed_tools is not None:
+            allowed = set(self._allowed_tools)
+            await self.update_tools([t for t in self.tools if _tool_name(t) in allowed])
         greeting = getattr(self, "_greeting_text", DEFAULT_GREETING)
         await self.session.generate_reply(
             instructions=greeting,
             allow_interruptions=True,
         )
 
+    async def on_user_turn_completed(self, turn_ctx: llm.ChatContext, new_message: llm.ChatMessage) -> None:
+        # Only record facts here; rewriting turn_ctx would invalidate the preemptive reply.
+        self._context.pin_facts(new_message.text_content or "")
+
+    async def on_exit(self):
+        await self._context.aclose()
+
     @function_tool()
     async def send_sms(self, context: RunContext, message: str) -> str:
         """Send an SMS to the caller on the current call. Use when the user asks to be texted a link, summary, or follow-up (e.g. booking link, quote confirmation, callback reminder). The message will be sent to the caller's phone for this call.
@@ -141,20 +1572,105 @@ class DefaultAgent(Agent):
         ok, msg = await asyncio.to_thread(_send_sms_sync, url, token, room_name, message.strip())
         return msg
 
+    @function_tool()
+    async def lookup_business_info(self, context: RunContext, query: str) -> str:
+        """Look up this business's packages, pricing, FAQs, venues and date availability. Use this before answering any question about prices, what a package includes, venues, or whether a date is open.
+
+        Args:
+            query: What the caller is asking about, in a few words (e.g. "wedding package price", "uplighting"). For availability include the event date as YYYY-MM-DD.
+        """
+        if self._knowledge is None or not len(self._knowledge):
+            return "Business info is not available right now; offer to have the team follow up with details."
+        lines = []
+        for y, m, d in _DATE_RE.findall(query):
+            lines.append(self._knowledge.availability(f"{y}-{m}-{d}"))
+        lines.extend(self._knowledge.search(query))
+        if not lines:
+            return "No matching information found; offer to have the team follow up with a custom quote."
+        return "\n".join(lines)
+
 
 server = AgentServer()
+main_diagnostics: Diagnostics | None = None  # set in the main worker process only (see __main__)
 
 
 def prewarm(proc: JobProcess):
+    # Start diagnostics first so tracemalloc sees everything the models allocate.
+    proc.userdata["diagnostics"] = Diagnostics.from_env()
     proc.userdata["vad"] = silero.VAD.load()
+    # No network here: the default initialize_process_timeout is 10s, and the main process keeps
+    # the shared on-disk caches warm (start_config_revalidation, start_knowledge_refresh).
+    proc.userdata["knowledge_store"] = KnowledgeStore.from_env()
+    proc.userdata["config_cache"] = AgentConfigCache.from_env()
 
 
 server.setup_fnc = prewarm
 
 
-@server.rtc_session(agent_name="Ben")
+# job id -> [persona name, accepted_at (monotonic), seen in server.active_jobs]. Main worker process only.
+_persona_reservations: dict[str, list] = {}
+_RESERVATION_LAUNCH_GRACE_SECONDS = 60.0
+
+
+def _persona_sessions(persona_name: str) -> int:
+    """Count accepted jobs for a persona, including ones accepted but not launched yet.
+
+    server.active_jobs lags behind accept(), so a reservation counts from accept until its job has
+    appeared there and then gone (the job ended), or until it never launched within the grace period.
+    """
+    active_ids = {info.job.id for info in server.active_jobs}
+    now = time.monotonic()
+    for job_id, reservation in list(_persona_reservations.items()):
+        if job_id in active_ids:
+            reservation[2] = True
+        elif reservation[2] or now - reservation[1] > _RESERVATION_LAUNCH_GRACE_SECONDS:
+            del _persona_reservations[job_id]
+    return sum(1 for r in _persona_reservations.values() if r[0] == persona_name)
+
+
+async def on_request(req: JobRequest) -> None:
+    """Runs in the main worker process: enforce per-persona session limits before accepting a job."""
+    if main_diagnostics is not None:
+        main_diagnostics.ensure_loop_monitor()  # first chance to run on the main process's event loop
+    persona_name, persona = resolve_persona(req.job)
+    if persona is None:
+        logger.warning("Rejecting job for room %s: unknown persona %r", req.room.name, persona_name)
+        await req.reject()
+        return
+    # Count and reserve with no await in between, so concurrent requests can't both take the last slot.
+    active = _persona_sessions(persona_name)
+    limit = persona["max_sessions"]
+    if limit and active >= limit:
+        logger.warning("Rejecting %s job for room %s: %d/%d sessions active", persona_name, req.room.name, active, limit)
+        await req.reject()
+        return
+    _persona_reservations[req.job.id] = [persona_name, time.monotonic(), False]
+    try:
+        await req.accept()
+    except Exception:
+        _persona_reservations.pop(req.job.id, None)
+        raise
+
+
+@server.rtc_session(agent_name=WORKER_AGENT_NAME, on_request=on_request)
 async def entrypoint(ctx: JobContext):
-    config = fetch_agent_config()
+    diagnostics: Diagnostics | None = ctx.proc.userdata.get("diagnostics")
+    if diagnostics is not None:
+        job_snapshot = await diagnostics.job_started(ctx.job.id)
+        ctx.add_shutdown_callback(lambda: diagnostics.job_finished(job_snapshot))
+    persona_name, persona = resolve_persona(ctx.job)
+    if persona is None:
+        # on_request rejects these; only reachable if the job was accepted some other way.
+        logger.warning("Unknown persona %r for room %s; using %s", persona_name, ctx.room.name, WORKER_AGENT_NAME)
+        persona_name, persona = WORKER_AGENT_NAME, PERSONAS.get(WORKER_AGENT_NAME) or next(iter(PERSONAS.values()))
+    logger.info("Starting %s session in room %s", persona_name, ctx.room.name)
+    config = await resolve_agent_config(ctx, persona["settings_name"])
+    knowledge_store: KnowledgeStore | None = ctx.proc.userdata.get("knowledge_store")
+    knowledge = None
+    if knowledge_store is not None:
+        # Same tenant as the config, so one organization's calls never see another's packages or calendar.
+        tenant = config.get("requested_organization_id") or config.get("organization_id")
+        knowledge = await asyncio.to_thread(knowledge_store.index_for, tenant)
     instructions = config.get("instructions") or DEFAULT_INSTRUCTIONS
     # Short prompt from admin (e.g. "You are the voice assistant for M10 DJ Company...") – prepend when present
     prompt = config.get("prompt") or ""
@@ -183,7 +1699,18 @@ async def entrypoint(ctx: JobContext):
         preemptive_generation=True,
     )
 
-    agent = DefaultAgent(instructions=instructions, greeting_text=greeting_text)
+    exporter = EventExporter.from_env(room_name=ctx.room.name, job_id=ctx.job.id)
+    if exporter is not None:
+        exporter.attach(session)
+        exporter.start()
+        ctx.add_shutdown_callback(exporter.aclose)
+
+    agent = DefaultAgent(
+        instructions=instructions,
+        greeting_text=greeting_text,
+        knowledge=knowledge,
+        allowed_tools=persona["tools"],
+    )
     agent._greeting_text = greeting_text
 
     await session.start(
@@ -214,4 +1741,8 @@ async def entrypoint(ctx: JobContext):
 
 
 if __name__ == "__main__":
+    # Only the long-lived main worker process gets here; job processes import this module.
+    main_diagnostics = Diagnostics.from_env(main=True)
+    start_config_revalidation(AgentConfigCache.from_env())
+    start_knowledge_refresh(KnowledgeStore.from_env())
     cli.run_app(server)
@@ -7,6 +7,12 @@ import { createClient } from '@supabase/supabase-js';
  * Returns LiveKit agent config for the Python (or other) agent to use at runtime.
  * Auth: Bearer token must match LIVEKIT_AGENT_CONFIG_TOKEN (set in env).
  * Used by the config-driven Ben agent so it can load instructions, greeting, STT/LLM/TTS from the admin UI.
+ *
+ * Query params (all optional):
+ * - organization_id: return that organization's settings (falls back to the platform default)
+ * - dialed_number: resolve the organization from an active dj_virtual_numbers row (e.g. SIP trunk number)
+ * - name: settings row name for a persona (default 'default_m10'), e.g. 'karaoke_hotline'
+ * - changed_since: ISO timestamp; returns { changed: [organization_id | null], now } for agent cache invalidation
  */
 export async function GET(request: NextRequest) {
   const authHeader = request.headers.get('authorization');
@@ -20,12 +26,67 @@ export async function GET(request: NextRequest) {
     process.env.SUPABASE_SERVICE_ROLE_KEY!
   );
 
-  const { data, error } = await supabase
-    .from('livekit_agent_settings')
-    .select('*')
-    .is('organization_id', null)
-    .eq('name', 'default_m10')
-    .maybeSingle();
+  const { searchParams } = new URL(request.url);
+
+  const changedSince = searchParams.get('changed_since');
+  if (changedSince) {
+    const now = new Date().toISOString();
+    const { data: changedRows, error: changedError } = await supabase
+      .from('livekit_agent_settings')
+      .select('organization_id')
+      .gt('updated_at', changedSince);
+    if (changedError) {
+      console.error('agent-config GET changed_since:', changedError);
+      return NextResponse.json(
+        { error: 'Failed to load config changes', message: changedError.message },
+        { status: 500 }
+      );
+    }
+    const changed = Array.from(
+      new Set((changedRows ?? []).map((r: { organization_id: string | null }) => r.organization_id))
+    );
+    return NextResponse.json({ changed, now });
+  }
+
+  const settingsName = searchParams.get('name') || 'default_m10';
+  let organizationId = searchParams.get('organization_id');
+  const dialedNumber = searchParams.get('dialed_number');
+  if (!organizationId && dialedNumber) {
+    const { data: numberRow } = await supabase
+      .from('dj_virtual_numbers')
+      .select('dj_profiles(organization_id)')
+      .eq('virtual_number', dialedNumber)
+      .eq('is_active', true)
+      .maybeSingle();
+    const profile = (numberRow as { dj_profiles?: { organization_id?: string | null } | null } | null)
+      ?.dj_profiles;
+    organizationId = profile?.organization_id ?? null;
+  }
+
+  let data: Record<string, unknown> | null = null;
+  let error: { message: string } | null = null;
+  if (organizationId) {
+    // Always match the persona's row: without a name, a tenant's newest row (e.g. a karaoke persona)
+    // would be served to its default agent.
+    const orgResult = await supabase
+      .from('livekit_agent_settings')
+      .select('*')
+      .eq('organization_id', organizationId)
+      .eq('name', settingsName)
+      .maybeSingle();
+    data = orgResult.data;
+    error = orgResult.error;
+  }
+  if (!data && !error) {
+    const defaultResult = await supabase
+      .from('livekit_agent_settings')
+      .select('*')
+      .is('organization_id', null)
+      .eq('name', settingsName)
+      .maybeSingle();
+    data = defaultResult.data;
+    error = defaultResult.error;
+  }
 
   if (error) {
     console.error('agent-config GET:', error);
@@ -37,6 +98,8 @@ export async function GET(request: NextRequest) {
 
   if (!data) {
     return NextResponse.json({
+      organization_id: null,
+      requested_organization_id: organizationId,
       agent_name: 'Ben',
       instructions: null,
       greeting_text: 'Greet the user and offer your assistance.',
@@ -70,6 +133,9 @@ export async function GET(request: NextRequest) {
   }
 
   return NextResponse.json({
+    organization_id: row.organization_id ?? null,
+    // Org resolved from the request, even when it has no settings row yet (agent cache invalidation).
+    requested_organization_id: organizationId,
     agent_name: row.agent_name ?? 'Ben',
     instructions: row.instructions ?? null,
     greeting_text: row.greeting_text ?? 'Greet the user and offer your assistance.',
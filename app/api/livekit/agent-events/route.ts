@@ -0,0 +1,76 @@
+import { NextRequest, NextResponse } from 'next/server';
+import { createClient } from '@supabase/supabase-js';
+import { gunzipSync } from 'zlib';
+
+/**
+ * POST /api/livekit/agent-events
+ *
+ * Ingest endpoint for the Ben agent's batched call events (AGENT_EVENTS_URL): transcripts,
+ * tool calls, per-turn latency and session close. Body is JSON, gzip-compressed when sent with
+ * Content-Encoding: gzip: { room, job_id, dropped, events: [{ type, ts, seq, ...data }] }.
+ * Auth: Bearer token must match AGENT_EVENTS_TOKEN or LIVEKIT_AGENT_CONFIG_TOKEN.
+ * Rows go to livekit_agent_events; (job_id, seq) is unique, so a resent batch is a no-op.
+ */
+export async function POST(request: NextRequest) {
+  const authHeader = request.headers.get('authorization');
+  const token = process.env.AGENT_EVENTS_TOKEN || process.env.LIVEKIT_AGENT_CONFIG_TOKEN;
+  if (!token || authHeader !== `Bearer ${token}`) {
+    return NextResponse.json({ error: 'Unauthorized' }, { status: 401 });
+  }
+
+  let body: {
+    room?: string;
+    job_id?: string;
+    dropped?: number;
+    events?: Array<{ type?: string; ts?: number; seq?: number; [key: string]: unknown }>;
+  };
+  try {
+    const raw = Buffer.from(await request.arrayBuffer());
+    const isGzip = (request.headers.get('content-encoding') || '').toLowerCase().includes('gzip');
+    body = JSON.parse((isGzip ? gunzipSync(raw) : raw).toString('utf-8'));
+  } catch {
+    return NextResponse.json({ error: 'Invalid body' }, { status: 400 });
+  }
+
+  const roomName = body.room;
+  const jobId = body.job_id;
+  if (!roomName || typeof roomName !== 'string' || !jobId || typeof jobId !== 'string') {
+    return NextResponse.json({ error: 'room and job_id required' }, { status: 400 });
+  }
+  if (body.dropped) {
+    console.warn(`[agent-events] ${roomName} (${jobId}): agent dropped ${body.dropped} events`);
+  }
+
+  const rows = (Array.isArray(body.events) ? body.events : [])
+    .filter((e) => e && typeof e.type === 'string' && typeof e.seq === 'number')
+    .map(({ type, ts, seq, ...payload }) => ({
+      room_name: roomName,
+      job_id: jobId,
+      seq,
+      event_type: type,
+      occurred_at: new Date((typeof ts === 'number' ? ts : Date.now() / 1000) * 1000).toISOString(),
+      payload,
+    }));
+  if (rows.length === 0) {
+    return NextResponse.json({ received: true, stored: 0 });
+  }
+
+  const supabase = createClient(
+    process.env.NEXT_PUBLIC_SUPABASE_URL!,
+    process.env.SUPABASE_SERVICE_ROLE_KEY!
+  );
+
+  const { error } = await supabase
+    .from('livekit_agent_events')
+    .upsert(rows, { onConflict: 'job_id,seq', ignoreDuplicates: true });
+
+  if (error) {
+    console.error('[agent-events] insert livekit_agent_events:', error);
+    return NextResponse.json(
+      { error: 'Failed to store events', message: error.message },
+      { status: 500 }
+    );
+  }
+
+  return NextResponse.json({ received: true, stored: rows.length });
+}
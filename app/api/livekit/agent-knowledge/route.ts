@@ -0,0 +1,133 @@
+import { NextRequest, NextResponse } from 'next/server';
+import { createClient } from '@supabase/supabase-js';
+
+const DEFAULT_ORGANIZATION_SLUG = 'm10djcompany';
+
+/**
+ * GET /api/livekit/agent-knowledge
+ *
+ * Returns the knowledge snapshot the Ben agent indexes in memory (AGENT_KNOWLEDGE_URL):
+ * active services as packages, FAQs, preferred venues and upcoming booked event dates.
+ * Auth: Bearer token must match AGENT_KNOWLEDGE_TOKEN or LIVEKIT_AGENT_CONFIG_TOKEN.
+ *
+ * Query params (all optional):
+ * - organization_id: whose data to return (default: M10 DJ Company). Every table is filtered by it.
+ * - since: ISO timestamp (a previous response's `version`); returns a delta with `full: false`:
+ *   only rows updated after `since`, plus `ids` (every active id per kind, so the agent drops
+ *   deleted or deactivated rows) and the complete `booked_dates` list.
+ */
+export async function GET(request: NextRequest) {
+  const authHeader = request.headers.get('authorization');
+  const token = process.env.AGENT_KNOWLEDGE_TOKEN || process.env.LIVEKIT_AGENT_CONFIG_TOKEN;
+  if (!token || authHeader !== `Bearer ${token}`) {
+    return NextResponse.json({ error: 'Unauthorized' }, { status: 401 });
+  }
+
+  const supabase = createClient(
+    process.env.NEXT_PUBLIC_SUPABASE_URL!,
+    process.env.SUPABASE_SERVICE_ROLE_KEY!
+  );
+
+  const { searchParams } = new URL(request.url);
+  const since = searchParams.get('since');
+  let requestedOrganizationId = searchParams.get('organization_id');
+  if (!requestedOrganizationId) {
+    const { data: org } = await supabase
+      .from('organizations')
+      .select('id')
+      .eq('slug', DEFAULT_ORGANIZATION_SLUG)
+      .maybeSingle();
+    requestedOrganizationId = org?.id ?? null;
+  }
+  if (!requestedOrganizationId) {
+    return NextResponse.json({ error: 'Organization not found' }, { status: 404 });
+  }
+  const organizationId = requestedOrganizationId;
+
+  // Taken before the queries, so a row updated while they run is picked up by the next delta.
+  const version = new Date().toISOString();
+  const today = version.slice(0, 10);
+
+  let servicesQuery = supabase
+    .from('services')
+    .select('id, service_name, category, description, features, base_price, price_notes')
+    .eq('organization_id', organizationId)
+    .eq('is_active', true)
+    .order('display_order', { ascending: true });
+  let faqsQuery = supabase
+    .from('faqs')
+    .select('id, question, answer')
+    .eq('organization_id', organizationId)
+    .eq('is_active', true)
+    .order('display_order', { ascending: true });
+  let venuesQuery = supabase
+    .from('preferred_venues')
+    .select(
+      'id, venue_name, venue_type, city, address, description, capacity_min, capacity_max, amenities, pricing_notes'
+    )
+    .eq('organization_id', organizationId)
+    .eq('is_active', true);
+  if (since) {
+    servicesQuery = servicesQuery.gt('updated_at', since);
+    faqsQuery = faqsQuery.gt('updated_at', since);
+    venuesQuery = venuesQuery.gt('updated_at', since);
+  }
+  const activeIds = (table: string) =>
+    supabase.from(table).select('id').eq('organization_id', organizationId).eq('is_active', true);
+
+  const [services, faqs, venues, events, serviceIds, faqIds, venueIds] = await Promise.all([
+    servicesQuery,
+    faqsQuery,
+    venuesQuery,
+    supabase
+      .from('events')
+      .select('event_date')
+      .eq('organization_id', organizationId)
+      .in('status', ['confirmed', 'in_progress'])
+      .gte('event_date', today),
+    since ? activeIds('services') : null,
+    since ? activeIds('faqs') : null,
+    since ? activeIds('preferred_venues') : null,
+  ]);
+
+  const failed = [services, faqs, venues, events, serviceIds, faqIds, venueIds].find((r) => r?.error);
+  if (failed?.error) {
+    console.error('agent-knowledge GET:', failed.error);
+    return NextResponse.json(
+      { error: 'Failed to load knowledge', message: failed.error.message },
+      { status: 500 }
+    );
+  }
+
+  const ids = (result: typeof serviceIds) => (result?.data ?? []).map((r: { id: string }) => r.id);
+
+  return NextResponse.json({
+    version,
+    full: !since,
+    organization_id: organizationId,
+    packages: (services.data ?? []).map((s) => ({
+      id: s.id,
+      name: s.service_name,
+      category: s.category,
+      description: s.description,
+      features: s.features,
+      price: s.base_price,
+      price_notes: s.price_notes,
+    })),
+    faqs: faqs.data ?? [],
+    venues: (venues.data ?? []).map((v) => ({
+      id: v.id,
+      name: v.venue_name,
+      venue_type: v.venue_type,
+      city: v.city,
+      address: v.address,
+      description: v.description,
+      capacity_min: v.capacity_min,
+      capacity_max: v.capacity_max,
+      amenities: v.amenities,
+      pricing_notes: v.pricing_notes,
+    })),
+    ...(since ? { ids: { packages: ids(serviceIds), faqs: ids(faqIds), venues: ids(venueIds) } } : {}),
+    booked_dates: Array.from(new Set((events.data ?? []).map((e) => String(e.event_date).slice(0, 10)))),
+  });
+}
@@ -0,0 +1,38 @@
+-- Batched call events from the LiveKit agent (Ben): transcripts, tool calls, per-turn latency.
+-- Written by POST /api/livekit/agent-events; one row per event.
+CREATE TABLE IF NOT EXISTS public.livekit_agent_events (
+  id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+  room_name TEXT NOT NULL,
+  job_id TEXT NOT NULL,
+  -- Per-job sequence number; (job_id, seq) makes a resent (spooled) batch idempotent
+  seq INTEGER NOT NULL,
+  event_type TEXT NOT NULL, -- 'transcript', 'tool_call', 'latency', 'session_closed'
+  occurred_at TIMESTAMPTZ NOT NULL,
+  payload JSONB DEFAULT '{}',
+  created_at TIMESTAMPTZ DEFAULT NOW(),
+  UNIQUE(job_id, seq)
+);
+
+CREATE INDEX IF NOT EXISTS idx_livekit_agent_events_room_name ON livekit_agent_events(room_name);
+CREATE INDEX IF NOT EXISTS idx_livekit_agent_events_occurred_at ON livekit_agent_events(occurred_at DESC);
+
+ALTER TABLE livekit_agent_events ENABLE ROW LEVEL SECURITY;
+
+-- Admins can read (same pattern as voice_calls)
+CREATE POLICY "Admins can view livekit_agent_events"
+  ON livekit_agent_events FOR SELECT
+  USING (
+    EXISTS (
+      SELECT 1 FROM admin_roles
+      WHERE admin_roles.email = (SELECT email FROM auth.users WHERE id = auth.uid())
+      AND admin_roles.is_active = true
+    )
+  );
+
+-- Service role for the ingest endpoint
+CREATE POLICY "Service role can manage livekit_agent_events"
+  ON livekit_agent_events FOR ALL
+  USING (true)
+  WITH CHECK (true);
+
+COMMENT ON TABLE livekit_agent_events IS 'LiveKit agent call events (transcripts, tool calls, latency) ingested in gzip batches';